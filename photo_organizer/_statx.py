@@ -0,0 +1,119 @@
+# photo_organizer/_statx.py
+
+import ctypes
+import errno
+import os
+import sys
+
+AT_FDCWD = -100
+AT_STATX_DONT_SYNC = 0x4000
+STATX_MTIME = 0x040
+
+
+class _StatxTimestamp(ctypes.Structure):
+    _fields_ = [
+        ("tv_sec", ctypes.c_int64),
+        ("tv_nsec", ctypes.c_uint32),
+        ("_reserved", ctypes.c_int32),
+    ]
+
+
+class _Statx(ctypes.Structure):
+    _fields_ = [
+        ("stx_mask", ctypes.c_uint32),
+        ("stx_blksize", ctypes.c_uint32),
+        ("stx_attributes", ctypes.c_uint64),
+        ("stx_nlink", ctypes.c_uint32),
+        ("stx_uid", ctypes.c_uint32),
+        ("stx_gid", ctypes.c_uint32),
+        ("stx_mode", ctypes.c_uint16),
+        ("_spare0", ctypes.c_uint16),
+        ("stx_ino", ctypes.c_uint64),
+        ("stx_size", ctypes.c_uint64),
+        ("stx_blocks", ctypes.c_uint64),
+        ("stx_attributes_mask", ctypes.c_uint64),
+        ("stx_atime", _StatxTimestamp),
+        ("stx_btime", _StatxTimestamp),
+        ("stx_ctime", _StatxTimestamp),
+        ("stx_mtime", _StatxTimestamp),
+        ("stx_rdev_major", ctypes.c_uint32),
+        ("stx_rdev_minor", ctypes.c_uint32),
+        ("stx_dev_major", ctypes.c_uint32),
+        ("stx_dev_minor", ctypes.c_uint32),
+        ("_spare2", ctypes.c_uint64 * 14),
+    ]
+
+
+# None until probed, then either the libc statx function or False
+_statx_func = None
+
+
+def _load_statx():
+    """
+    Look up and probe the libc statx wrapper once.
+
+    Returns:
+    The ctypes function, or False if statx is not usable on this system.
+    """
+    global _statx_func
+    if _statx_func is not None:
+        return _statx_func
+
+    _statx_func = False
+    if not sys.platform.startswith("linux"):
+        return _statx_func
+    try:
+        # The interpreter is linked against libc already, look statx up in
+        # the global namespace instead of searching for the library
+        libc = ctypes.CDLL(None, use_errno=True)
+        func = libc.statx
+    except (OSError, AttributeError):
+        return _statx_func
+
+    func.argtypes = [
+        ctypes.c_int,
+        ctypes.c_char_p,
+        ctypes.c_int,
+        ctypes.c_uint,
+        ctypes.POINTER(_Statx),
+    ]
+    func.restype = ctypes.c_int
+
+    buf = _Statx()
+    if func(AT_FDCWD, b"/", AT_STATX_DONT_SYNC, STATX_MTIME, ctypes.byref(buf)) == 0:
+        _statx_func = func
+    return _statx_func
+
+
+def statx_mtime(path):
+    """
+    Get the modification time of a file using statx where available.
+
+    statx is called with AT_STATX_DONT_SYNC and only requests the mtime,
+    so network filesystems do not need to sync attributes with the server.
+    Falls back to os.stat if statx is not available.
+
+    Parameters:
+    path (str): The path to the file.
+
+    Returns:
+    float: The modification time in seconds since the epoch.
+    """
+    func = _load_statx()
+    if func:
+        buf = _Statx()
+        ret = func(
+            AT_FDCWD,
+            os.fsencode(path),
+            AT_STATX_DONT_SYNC,
+            STATX_MTIME,
+            ctypes.byref(buf),
+        )
+        if ret == 0:
+            if buf.stx_mask & STATX_MTIME:
+                return buf.stx_mtime.tv_sec + buf.stx_mtime.tv_nsec / 1e9
+        else:
+            err = ctypes.get_errno()
+            if err != errno.ENOSYS:
+                raise OSError(err, os.strerror(err), path)
+    return os.stat(path).st_mtime
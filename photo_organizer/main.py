@@ -1,14 +1,193 @@
 # photo_organizer/main.py
 
 import argparse
+import collections
+import contextlib
 import os
+import sys
+import stat
 import shutil
-import datetime
+import errno
 import logging
-import filecmp
+import math
+import operator
+import hashlib
+import io
+import mmap
+import functools
+import re
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from logging.handlers import QueueHandler, QueueListener
 
+if sys.platform.startswith("linux"):
+    import fcntl
 
-def list_files(source, recursive=False, file_endings=None):
+logger = logging.getLogger(__name__)
+
+# Block size when reading or comparing file contents, per-block overhead
+# stops mattering well before 1 MiB while a block still fits in L2 cache
+BLOCK_SIZE = 1 << 20
+# Bytes compared directly before falling back to a full digest
+HEAD_SIZE = 1 << 20
+# Size of the windows sampled from the middle and end of larger files
+SAMPLE_SIZE = 1 << 16
+# ioctl request to reflink a whole file on Linux
+FICLONE = 0x40049409
+# Devices whose filesystem cannot reflink, FICLONE is not tried there again
+_no_clone_devices = set()
+# Files always compared in full, others only by samples with --fast-dedup
+PHOTO_EXTENSIONS = frozenset(
+    {
+        ".jpg",
+        ".jpeg",
+        ".png",
+        ".gif",
+        ".heic",
+        ".heif",
+        ".tif",
+        ".tiff",
+        ".dng",
+        ".raw",
+        ".cr2",
+        ".cr3",
+        ".nef",
+        ".arw",
+        ".orf",
+        ".rw2",
+        ".raf",
+    }
+)
+
+
+def _stat_or_none(path):
+    try:
+        if isinstance(path, os.DirEntry):
+            # DirEntry caches the stat result (for free on Windows)
+            return path.stat()
+        return os.stat(path)
+    except OSError as e:
+        logger.debug("Failed to stat '%s': %s", os.fspath(path), e)
+        return None
+
+
+def stat_files(paths, stat_threads=1):
+    """
+    Stat a list of paths, optionally in parallel.
+
+    Stat calls are bound by syscall latency rather than CPU, so on slow or
+    network storage issuing them from several threads hides most of that
+    latency.
+
+    Parameters:
+    paths (list): List of paths or os.DirEntry objects to stat.
+    stat_threads (int): Number of threads used to stat the paths. Default is 1.
+
+    Returns:
+    list: A list of (path, os.stat_result) tuples in the order of paths.
+    Paths that could not be stat'ed (e.g. broken symlinks) are left out.
+    """
+    if stat_threads > 1 and len(paths) > 1:
+        with ThreadPoolExecutor(max_workers=stat_threads) as executor:
+            stats = list(executor.map(_stat_or_none, paths))
+    else:
+        stats = [_stat_or_none(path) for path in paths]
+    return [(os.fspath(path), st) for path, st in zip(paths, stats) if st is not None]
+
+
+def _same_device(entry, device):
+    try:
+        return entry.stat(follow_symlinks=False).st_dev == device
+    except OSError as e:
+        logger.warning("Failed to stat directory '%s': %s", entry.path, e)
+        return False
+
+
+def _scan_one(directory, recursive, source_dev):
+    files = []
+    subdirs = []
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if recursive and (
+                        source_dev is None or _same_device(entry, source_dev)
+                    ):
+                        subdirs.append(entry.path)
+                else:
+                    files.append(entry)
+    except OSError as e:
+        logger.warning("Failed to scan directory '%s': %s", directory, e)
+    return files, subdirs
+
+
+def scan_directory(source, recursive=False, one_filesystem=False, scan_threads=1):
+    """
+    Yield all non-directory entries of the source directory.
+
+    Uses os.scandir directly so the entry type comes from the directory
+    listing itself instead of a stat call per entry. Symlinked directories
+    are not followed. With several scan threads, subdirectories are listed
+    in parallel, which hides the per-directory latency of slow or network
+    storage. Entries are still yielded in a deterministic order.
+
+    Parameters:
+    source (str): The source directory path.
+    recursive (bool): If True, descend into subdirectories. Default is False.
+    one_filesystem (bool): If True, do not descend into subdirectories on
+    another filesystem than the source. Default is False.
+    scan_threads (int): Number of threads used to list directories when
+    recursive. Default is 1.
+
+    Yields:
+    os.DirEntry: The directory entries that are not directories.
+    """
+    # Only stat directories, and only when staying on one filesystem
+    source_dev = os.stat(source).st_dev if recursive and one_filesystem else None
+    if recursive and scan_threads > 1:
+        with ThreadPoolExecutor(max_workers=scan_threads) as executor:
+            # Consume the listings in submission order (breadth first)
+            pending = collections.deque(
+                [executor.submit(_scan_one, source, True, source_dev)]
+            )
+            while pending:
+                files, subdirs = pending.popleft().result()
+                for subdir in subdirs:
+                    pending.append(executor.submit(_scan_one, subdir, True, source_dev))
+                yield from files
+        return
+
+    stack = [source]
+    while stack:
+        files, subdirs = _scan_one(stack.pop(), recursive, source_dev)
+        stack.extend(subdirs)
+        yield from files
+
+
+@functools.lru_cache(maxsize=64)
+def _compile_endings(file_endings):
+    """
+    Compile the file endings into a single case-insensitive regex.
+
+    One alternation pattern is matched in C per file name instead of
+    lowercasing every name and comparing it against each ending in turn.
+    Cached so the pattern is only compiled once per unique set of endings.
+
+    Parameters:
+    file_endings (tuple): File endings/extensions to include.
+
+    Returns:
+    re.Pattern: A pattern matching names that end with one of the endings.
+    """
+    alternation = "|".join(re.escape(ending) for ending in file_endings)
+    return re.compile(f"(?:{alternation})\\Z", re.IGNORECASE)
+
+
+def list_files(
+    source, recursive=False, file_endings=None, stat_threads=1, one_filesystem=False
+):
     """
     List all files in the source directory.
 
@@ -16,54 +195,125 @@ def list_files(source, recursive=False, file_endings=None):
     source (str): The source directory path.
     recursive (bool): If True, list files recursively. Default is False.
     file_endings (list): List of file endings/extensions to include. Default is None.
+    stat_threads (int): Number of threads used to scan directories and stat the
+    files. Default is 1.
+    one_filesystem (bool): If True, stay on the filesystem of the source.
+    Default is False.
 
     Returns:
-    list: A list of file paths.
-    """
-    file_list = []
-    if recursive:
-        for root, dirs, files in os.walk(source):
-            for file in files:
-                if not file_endings or file.lower().endswith(tuple(file_endings)):
-                    file_list.append(os.path.join(root, file))
+    list: A list of (file path, os.stat_result) tuples.
+    """
+    if file_endings:
+        match_ending = _compile_endings(tuple(file_endings)).search
+        candidates = [
+            entry
+            for entry in scan_directory(source, recursive, one_filesystem, stat_threads)
+            if match_ending(entry.name)
+        ]
     else:
-        with os.scandir(source) as entries:
-            for entry in entries:
-                if entry.is_file() and (
-                    not file_endings or entry.name.lower().endswith(tuple(file_endings))
-                ):
-                    file_list.append(entry.path)
-    logging.debug(f"Listed {len(file_list)} files from {source}")
+        candidates = list(
+            scan_directory(source, recursive, one_filesystem, stat_threads)
+        )
+    file_list = [
+        (path, st)
+        for path, st in stat_files(candidates, stat_threads)
+        if stat.S_ISREG(st.st_mode)
+    ]
+    logger.debug("Listed %d files from %s", len(file_list), source)
     return file_list
 
 
-def get_creation_date(file_path):
+# Pick the stat field holding the creation time once at import
+if os.name == "nt":  # Windows
+    _creation_timestamp = operator.attrgetter("st_ctime")
+elif hasattr(os.stat_result, "st_birthtime"):  # macOS and BSDs
+    _creation_timestamp = operator.attrgetter("st_birthtime")
+else:  # Linux
+    # Fallback to the last modification time (best approximation)
+    _creation_timestamp = operator.attrgetter("st_mtime")
+
+
+@functools.lru_cache(maxsize=65536)
+def _utc_offset(quarter_hour):
+    # Offsets change rarely, but not always on a quarter hour (Newfoundland
+    # switched at 00:01 local time), None if it changes within this one
+    start = quarter_hour * 900
+    offset = time.localtime(start).tm_gmtoff
+    if time.localtime(start + 899).tm_gmtoff != offset:
+        return None
+    return offset
+
+
+# Imports span few distinct days, a cache hit beats even the integer math
+@functools.lru_cache(maxsize=65536)
+def _civil_from_days(days):
+    # Howard Hinnant's civil_from_days, days since 1970-01-01 to a date
+    days += 719468
+    era = days // 146097
+    day_of_era = days - era * 146097
+    year_of_era = (
+        day_of_era - day_of_era // 1460 + day_of_era // 36524 - day_of_era // 146096
+    ) // 365
+    day_of_year = day_of_era - (
+        365 * year_of_era + year_of_era // 4 - year_of_era // 100
+    )
+    shifted_month = (5 * day_of_year + 2) // 153
+    day = day_of_year - (153 * shifted_month + 2) // 5 + 1
+    month = shifted_month + 3 if shifted_month < 10 else shifted_month - 9
+    year = year_of_era + era * 400 + (month <= 2)
+    return year, month, day
+
+
+def _creation_date_from_timestamp(creation_time, file_path):
+    seconds = math.floor(creation_time)
+    offset = _utc_offset(seconds // 900)
+    if offset is None:
+        local = time.localtime(seconds)
+        year, month, day = local.tm_year, local.tm_mon, local.tm_mday
+    else:
+        year, month, day = _civil_from_days((seconds + offset) // 86400)
+
+    # Formatted lazily, this runs for every file even without --verbose
+    logger.debug("File %s creation date: %d-%02d-%02d", file_path, year, month, day)
+    return year, month, day
+
+
+def get_creation_date_from_stat(stat_result, file_path):
+    """
+    Extract year, month, and day of the creation date from a stat result.
+
+    Parameters:
+    stat_result (os.stat_result): The stat result of the file.
+    file_path (str): The path to the file, used for logging.
+
+    Returns:
+    tuple: A tuple containing the year, month, and day.
+    """
+    return _creation_date_from_timestamp(_creation_timestamp(stat_result), file_path)
+
+
+def get_creation_date(file_path, stat_result=None):
     """
     Get the creation date of a file and extract year, month, and day.
 
     Parameters:
     file_path (str): The path to the file.
+    stat_result (os.stat_result): Stat result of the file if already known,
+    skips the stat call. Default is None.
 
     Returns:
     tuple: A tuple containing the year, month, and day.
     """
-    if os.name == "nt":  # Windows
-        creation_time = os.path.getctime(file_path)
-    else:  # macOS or Linux
-        stat = os.stat(file_path)
-        try:
-            creation_time = stat.st_birthtime
-        except AttributeError:
-            # Fallback to the last metadata change time (best approximation)
-            creation_time = stat.st_mtime
+    if stat_result is not None:
+        return get_creation_date_from_stat(stat_result, file_path)
+    if sys.platform.startswith("linux"):
+        # Imported lazily, ctypes is only needed for path based lookups by
+        # library callers, organize_files reuses the listing's stat results
+        from photo_organizer import _statx
 
-    creation_date = datetime.datetime.fromtimestamp(creation_time)
-    year = creation_date.year
-    month = creation_date.month
-    day = creation_date.day
-
-    logging.debug(f"File {file_path} creation date: {year}-{month:02d}-{day:02d}")
-    return year, month, day
+        # Linux has no birth time in os.stat, only the mtime is used
+        return _creation_date_from_timestamp(_statx.statx_mtime(file_path), file_path)
+    return get_creation_date_from_stat(os.stat(file_path), file_path)
 
 
 def ensure_directory_exists(folder_path):
@@ -73,24 +323,51 @@ def ensure_directory_exists(folder_path):
     Parameters:
     folder_path (str): The path to the folder.
     """
-    if not os.path.exists(folder_path):
-        os.makedirs(folder_path)
-        logging.info(f"Created missing directories for path: {folder_path}")
-    else:
-        logging.debug(f"Directory already exists: {folder_path}")
+    # A single mkdir covers both the common cases (parent exists, folder
+    # exists or not) and cannot race with another process creating it
+    try:
+        os.mkdir(folder_path)
+    except FileExistsError:
+        logger.debug("Directory already exists: %s", folder_path)
+        return
+    except FileNotFoundError:
+        os.makedirs(folder_path, exist_ok=True)
+    logger.info("Created missing directories for path: %s", folder_path)
 
 
 def configure_logging(verbose):
     """
     Configure logging settings.
 
+    Log records are handed to a background thread through a queue, so
+    logging from the per-file hot path does not wait on writes to stderr.
+
     Parameters:
     verbose (bool): If True, enable verbose logging.
+
+    Returns:
+    QueueListener: The started listener, stop it to flush pending records.
     """
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
+    log_queue = queue.SimpleQueue()
+    queue_handler = QueueHandler(log_queue)
+    # Only merge the arguments into the message, the listener does the rest
+    queue_handler.setFormatter(logging.Formatter("%(message)s"))
+    listener = QueueListener(log_queue, handler)
     logging.basicConfig(
         level=logging.DEBUG if verbose else logging.INFO,
-        format="%(asctime)s - %(levelname)s - %(message)s",
+        handlers=[queue_handler],
     )
+    listener.start()
+    return listener
+
+
+def _positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be a positive integer, got {value}")
+    return number
 
 
 def parse_arguments():
@@ -133,62 +410,604 @@ def parse_arguments():
         action="store_true",
         help="Do not place month folders inside a year folder",
     )
+    parser.add_argument(
+        "-x",
+        "--one-filesystem",
+        action="store_true",
+        help="Do not descend into directories on other filesystems",
+    )
+    parser.add_argument(
+        "--fast-dedup",
+        action="store_true",
+        help="Compare existing non-photo files (e.g. videos) by size and "
+        "samples instead of their full content",
+    )
+    parser.add_argument(
+        "--hash-cache",
+        type=str,
+        metavar="FILE",
+        help="SQLite file caching digests of compared files between runs",
+    )
+    parser.add_argument(
+        "--copy-threads",
+        type=_positive_int,
+        default=None,
+        help="Number of threads used to move or copy files "
+        "(default: CPU count + 4, at most 32)",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=_positive_int,
+        default=1,
+        help="Number of files handed to a copy thread at once (default: 1)",
+    )
+    parser.add_argument(
+        "--stat-threads",
+        type=_positive_int,
+        default=8,
+        help="Number of threads used to scan directories and stat files while "
+        "listing the source",
+    )
 
     return parser.parse_args()
 
 
-def organize_files(args, files):
+def _file_digest(file_path):
+    with open(file_path, "rb", buffering=0) as f:
+        try:
+            # Hash straight from the page cache, hashlib releases the GIL
+            # while digesting large buffers
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return hashlib.blake2b(mm).digest()
+        except (OSError, ValueError):
+            # Some filesystems (e.g. FUSE mounts) do not support mmap
+            pass
+        if sys.version_info >= (3, 11):
+            return hashlib.file_digest(f, "blake2b").digest()
+        hash_obj = hashlib.blake2b()
+        for chunk in iter(lambda: f.read(BLOCK_SIZE), b""):
+            hash_obj.update(chunk)
+        return hash_obj.digest()
+
+
+def _read_blocks_equal(f1, f2):
+    # Unbuffered reads may return short blocks (e.g. on FUSE or network
+    # mounts), buffered reads only return short at the end of the file
+    f1 = io.BufferedReader(f1, BLOCK_SIZE)
+    f2 = io.BufferedReader(f2, BLOCK_SIZE)
+    while True:
+        block = f1.read(BLOCK_SIZE)
+        if block != f2.read(BLOCK_SIZE):
+            return False
+        if not block:
+            return True
+
+
+def _contents_equal(file_path, target_path):
+    # Compare two files of equal size block by block and stop at the first
+    # difference. Slices of a mapping are compared with memcmp, files that
+    # cannot be mapped are read in lockstep instead.
+    with open(file_path, "rb", buffering=0) as f1:
+        with open(target_path, "rb", buffering=0) as f2:
+            try:
+                m1 = mmap.mmap(f1.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError):
+                return _read_blocks_equal(f1, f2)
+            with m1:
+                try:
+                    m2 = mmap.mmap(f2.fileno(), 0, access=mmap.ACCESS_READ)
+                except (OSError, ValueError):
+                    return _read_blocks_equal(f1, f2)
+                with m2:
+                    if len(m1) != len(m2):
+                        return False
+                    return all(
+                        m1[offset : offset + BLOCK_SIZE]
+                        == m2[offset : offset + BLOCK_SIZE]
+                        for offset in range(0, len(m1), BLOCK_SIZE)
+                    )
+
+
+def _cached_digest(file_path, file_stat, hash_cache):
+    key = (file_stat.st_dev, file_stat.st_ino)
+    entry = hash_cache.get(key)
+    if entry is not None and entry[:2] == (file_stat.st_size, file_stat.st_mtime_ns):
+        return entry[2]
+    return None
+
+
+def _digest(file_path, file_stat, hash_cache):
+    if hash_cache is None:
+        return _file_digest(file_path)
+    digest = _cached_digest(file_path, file_stat, hash_cache)
+    if digest is None:
+        digest = _file_digest(file_path)
+        hash_cache[(file_stat.st_dev, file_stat.st_ino)] = (
+            file_stat.st_size,
+            file_stat.st_mtime_ns,
+            digest,
+        )
+    return digest
+
+
+def load_hash_cache(cache_path):
     """
-    Organize files by moving or copying them to the target directory.
+    Load the persistent digest cache.
 
     Parameters:
-    args (Namespace): Parsed command line arguments.
-    files (list): List of file paths to organize.
-    """
-    for file_path in files:
-        year, month, day = get_creation_date(file_path)
-        if args.no_year:
-            if args.daily:
-                target_folder = os.path.join(
-                    args.target, f"{year}-{month:02d}", f"{day:02d}"
-                )
-            else:
-                target_folder = os.path.join(args.target, f"{year}-{month:02d}")
-        else:
-            if args.daily:
-                target_folder = os.path.join(
-                    args.target, str(year), f"{month:02d}", f"{day:02d}"
-                )
-            else:
-                target_folder = os.path.join(args.target, str(year), f"{month:02d}")
+    cache_path (str): The path of the SQLite cache database.
+
+    Returns:
+    dict: Digests keyed by (st_dev, st_ino), valued (st_size, st_mtime_ns, digest).
+    """
+    hash_cache = {}
+    if not os.path.exists(cache_path):
+        return hash_cache
+    # Imported lazily, most runs do not use a hash cache
+    import sqlite3
+
+    try:
+        with contextlib.closing(sqlite3.connect(cache_path)) as connection:
+            rows = connection.execute(
+                "SELECT dev, inode, size, mtime_ns, digest FROM hashes"
+            )
+            for dev, inode, size, mtime_ns, digest in rows:
+                hash_cache[(dev, inode)] = (size, mtime_ns, digest)
+    except sqlite3.DatabaseError as e:
+        # Empty, truncated or foreign files, start over with an empty cache
+        logger.warning("Ignoring unreadable hash cache '%s': %s", cache_path, e)
+        return {}
+    logger.debug("Loaded %d cached digests from %s", len(hash_cache), cache_path)
+    return hash_cache
 
-        ensure_directory_exists(target_folder)
-        target_path = os.path.join(target_folder, os.path.basename(file_path))
 
-        if os.path.exists(target_path):
-            if filecmp.cmp(file_path, target_path, shallow=False):
-                logging.warning(
-                    f"File '{target_path}' already exists and is identical. Skipping."
+def save_hash_cache(cache_path, hash_cache):
+    """
+    Store the digest cache in a single transaction.
+
+    Parameters:
+    cache_path (str): The path of the SQLite cache database.
+    hash_cache (dict): The digest cache as returned by load_hash_cache.
+    """
+    import sqlite3
+
+    ensure_directory_exists(os.path.dirname(os.path.abspath(cache_path)))
+    try:
+        with contextlib.closing(sqlite3.connect(cache_path)) as connection:
+            with connection:
+                connection.execute(
+                    "CREATE TABLE IF NOT EXISTS hashes (dev INTEGER, inode INTEGER, "
+                    "size INTEGER, mtime_ns INTEGER, digest BLOB, "
+                    "PRIMARY KEY (dev, inode))"
                 )
-                continue
-            else:
-                logging.error(
-                    f"File '{target_path}' already exists and is different. Aborting."
+                connection.executemany(
+                    "INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?)",
+                    (key + value for key, value in hash_cache.items()),
                 )
+    except sqlite3.DatabaseError as e:
+        # The files are already sorted, only the cache is lost
+        logger.warning("Failed to save hash cache '%s': %s", cache_path, e)
+
+
+def files_are_identical(
+    file_path, target_path, file_stat=None, full_compare=True, hash_cache=None
+):
+    """
+    Check if two files have identical content.
+
+    Sizes are compared first, then a small first block and then the rest of
+    the first HEAD_SIZE bytes of both files. Larger files additionally get a
+    window in the middle and at the end compared, so files that differ are
+    usually told apart without reading them in full. Only if all of these
+    match are the full contents compared, unless full_compare is False.
+    The contents are compared directly, or via their digests if a
+    hash_cache is given so the digests can be reused in later runs.
+
+    Parameters:
+    file_path (str): The path of the first file.
+    target_path (str): The path of the second file.
+    file_stat (os.stat_result): Cached stat result of file_path. Default is None.
+    full_compare (bool): If False, trust the sampled windows instead of
+    comparing the full contents. Default is True.
+    hash_cache (dict): Digests of earlier runs from load_hash_cache, updated
+    with new digests. Default is None.
+
+    Returns:
+    bool: True if the files have the same content.
+    """
+    if file_stat is None:
+        file_stat = os.stat(file_path)
+    target_stat = os.stat(target_path)
+    if file_stat.st_size != target_stat.st_size:
+        return False
+    size = file_stat.st_size
+    if hash_cache is not None and size > HEAD_SIZE:
+        # Skip all reads if both digests are known from an earlier run
+        digest = _cached_digest(file_path, file_stat, hash_cache)
+        target_digest = _cached_digest(target_path, target_stat, hash_cache)
+        if digest is not None and target_digest is not None:
+            return digest == target_digest
+    with open(file_path, "rb") as f1, open(target_path, "rb") as f2:
+        for block_size in (4096, HEAD_SIZE - 4096):
+            if f1.read(block_size) != f2.read(block_size):
+                return False
+        if size <= HEAD_SIZE:
+            return True
+        # Sample the middle and the end before reading everything
+        for offset in (size // 2 - SAMPLE_SIZE // 2, size - SAMPLE_SIZE):
+            f1.seek(offset)
+            f2.seek(offset)
+            if f1.read(SAMPLE_SIZE) != f2.read(SAMPLE_SIZE):
+                return False
+    if not full_compare:
+        return True
+    if hash_cache is None:
+        return _contents_equal(file_path, target_path)
+    return _digest(file_path, file_stat, hash_cache) == _digest(
+        target_path, target_stat, hash_cache
+    )
+
+
+def _remove_quietly(path):
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+def move_file(file_path, target_path, same_device=False):
+    """
+    Move a file to the target path without replacing an existing file.
+
+    If source and target are on the same filesystem the file is hard linked
+    to the target and then unlinked, which fails atomically if the target
+    already exists. Otherwise the target is created exclusively first and
+    the file is moved over it.
+
+    Parameters:
+    file_path (str): The path of the file to move.
+    target_path (str): The path to move the file to.
+    same_device (bool): If True, source and target share a filesystem.
+
+    Raises:
+    FileExistsError: If the target path already exists.
+    """
+    if same_device:
+        try:
+            os.link(file_path, target_path)
+        except FileExistsError:
+            raise
+        except OSError as e:
+            # Filesystems like FAT do not support hard links
+            logger.debug("Failed to hard link '%s': %s", file_path, e)
+        else:
+            os.unlink(file_path)
+            return
+
+    # Claim the target, raises FileExistsError if it is already taken
+    os.close(os.open(target_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL))
+    try:
+        if same_device:
+            try:
+                os.replace(file_path, target_path)
                 return
+            except OSError as e:
+                if e.errno != errno.EXDEV:
+                    raise
+        shutil.move(file_path, target_path)
+    except BaseException:
+        _remove_quietly(target_path)
+        raise
+
+
+def _copy_data(fsrc, fdst, same_device):
+    src_fd = fsrc.fileno()
+    dst_fd = fdst.fileno()
+    src_stat = os.fstat(src_fd)
+    size = src_stat.st_size
+    if same_device and src_stat.st_dev not in _no_clone_devices:
+        try:
+            # Share the source's extents on CoW filesystems (Btrfs, XFS)
+            fcntl.ioctl(dst_fd, FICLONE, src_fd)
+            return
+        except OSError as e:
+            if e.errno in (errno.EOPNOTSUPP, errno.EXDEV, errno.EINVAL, errno.ENOTTY):
+                _no_clone_devices.add(src_stat.st_dev)
+            logger.debug("Failed to clone '%s': %s", fsrc.name, e)
+    copied = 0
+    if same_device and hasattr(os, "copy_file_range"):  # Linux, Python 3.8+
+        try:
+            while copied < size:
+                sent = os.copy_file_range(src_fd, dst_fd, size - copied, copied, copied)
+                if sent == 0:
+                    # Some filesystems (e.g. FUSE) report no progress instead
+                    # of an error, let sendfile copy the rest
+                    break
+                copied += sent
+        except OSError as e:
+            if e.errno not in (
+                errno.EXDEV,
+                errno.ENOSYS,
+                errno.EINVAL,
+                errno.EOPNOTSUPP,
+            ):
+                raise
+        if copied == size:
+            return
+        # copy_file_range does not move the file position, sendfile uses it
+        os.lseek(dst_fd, copied, os.SEEK_SET)
+    # sendfile copies in the kernel without a userspace buffer
+    while copied < size:
+        sent = os.sendfile(dst_fd, src_fd, copied, size - copied)
+        if sent == 0:
+            break
+        copied += sent
+    if copied < size:
+        raise OSError(errno.EIO, f"Copied only {copied} of {size} bytes", fsrc.name)
+
+
+def copy_file(file_path, target_path, same_device=False):
+    """
+    Copy a file including its metadata to the target path.
+
+    The target is created exclusively, so an existing file is never
+    replaced. On Linux, if source and target are on the same filesystem the
+    target is first cloned with the FICLONE ioctl, which shares the source's extents
+    on filesystems with reflink support (e.g. Btrfs, XFS). If that is not
+    supported the data is copied in the kernel with os.copy_file_range,
+    otherwise with os.sendfile. On other platforms the claimed target is
+    overwritten by shutil.copy2, which uses the platform's own copy call
+    (e.g. fcopyfile on macOS).
+
+    Parameters:
+    file_path (str): The path of the file to copy.
+    target_path (str): The path to copy the file to.
+    same_device (bool): If True, source and target share a filesystem.
+
+    Raises:
+    FileExistsError: If the target path already exists.
+    """
+    if not sys.platform.startswith("linux"):
+        # Claim the target, raises FileExistsError if it is already taken
+        os.close(os.open(target_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL))
+        try:
+            shutil.copy2(file_path, target_path)
+        except BaseException:
+            _remove_quietly(target_path)
+            raise
+        return
+
+    with open(file_path, "rb") as fsrc, open(target_path, "xb") as fdst:
+        try:
+            _copy_data(fsrc, fdst, same_device)
+        except BaseException:
+            fdst.close()
+            _remove_quietly(target_path)
+            raise
+    shutil.copystat(file_path, target_path)
+
+
+def get_target_folder(args, year, month, day):
+    """
+    Build the target folder for a creation date.
+
+    Parameters:
+    args (Namespace): Parsed command line arguments.
+    year (int): The creation year.
+    month (int): The creation month.
+    day (int): The creation day.
+
+    Returns:
+    str: The path of the target folder.
+    """
+    if args.no_year:
+        if args.daily:
+            return os.path.join(args.target, f"{year}-{month:02d}", f"{day:02d}")
+        return os.path.join(args.target, f"{year}-{month:02d}")
+    if args.daily:
+        return os.path.join(args.target, str(year), f"{month:02d}", f"{day:02d}")
+    return os.path.join(args.target, str(year), f"{month:02d}")
 
+
+def transfer_file(
+    file_path,
+    target_path,
+    file_stat,
+    do_copy,
+    same_device,
+    full_compare,
+    hash_cache,
+    failed,
+):
+    """
+    Move or copy a single file to its target path.
+
+    If the target path already exists the file is skipped when both are
+    identical, otherwise the conflict is reported and all later transfers
+    are stopped.
+
+    Parameters:
+    file_path (str): The path of the file to transfer.
+    target_path (str): The path to transfer the file to.
+    file_stat (os.stat_result): Cached stat result of file_path.
+    do_copy (bool): If True, copy the file instead of moving it.
+    same_device (bool): If True, source and target share a filesystem.
+    full_compare (bool): If False, an existing target is compared by samples.
+    hash_cache (dict): Persistent digest cache, or None.
+    failed (threading.Event): Set when a transfer fails, skips all later ones.
+    """
+    if failed.is_set():
+        return
+    try:
+        if do_copy:
+            copy_file(file_path, target_path, same_device)
+            logger.info("Copied '%s' to '%s'", file_path, target_path)
+        else:
+            move_file(file_path, target_path, same_device)
+            logger.info("Moved '%s' to '%s'", file_path, target_path)
+    except FileExistsError:
         try:
-            if args.copy:
-                shutil.copy2(file_path, target_path)
-                logging.info(f"Copied '{file_path}' to '{target_path}'")
-            else:
-                shutil.move(file_path, target_path)
-                logging.info(f"Moved '{file_path}' to '{target_path}'")
+            identical = files_are_identical(
+                file_path, target_path, file_stat, full_compare, hash_cache
+            )
         except Exception as e:
-            logging.error(
-                f"Failed to {'copy' if args.copy else 'move'} '{file_path}' to '{target_path}': {e}"
+            failed.set()
+            logger.error(
+                "Failed to compare '%s' with existing '%s': %s",
+                file_path,
+                target_path,
+                e,
             )
             return
+        if identical:
+            logger.warning(
+                "File '%s' already exists and is identical. Skipping.", target_path
+            )
+        else:
+            failed.set()
+            logger.error(
+                "File '%s' already exists and is different. Aborting.", target_path
+            )
+    except Exception as e:
+        failed.set()
+        logger.error(
+            "Failed to %s '%s' to '%s': %s",
+            "copy" if do_copy else "move",
+            file_path,
+            target_path,
+            e,
+        )
+
+
+def transfer_batch(batch, do_copy, hash_cache, failed):
+    """
+    Move or copy a batch of files one after another.
+
+    Parameters:
+    batch (list): List of (file path, target path, os.stat_result,
+    same_device, full_compare) tuples, see transfer_file.
+    do_copy (bool): If True, copy the files instead of moving them.
+    hash_cache (dict): Persistent digest cache, or None.
+    failed (threading.Event): Set when a transfer fails, skips all later ones.
+    """
+    for file_path, target_path, file_stat, same_device, full_compare in batch:
+        transfer_file(
+            file_path,
+            target_path,
+            file_stat,
+            do_copy,
+            same_device,
+            full_compare,
+            hash_cache,
+            failed,
+        )
+
+
+def plan_files(args, files):
+    """
+    Work out the target folder of every file, grouped by target folder.
+
+    Parameters:
+    args (Namespace): Parsed command line arguments.
+    files (list): List of (file path, os.stat_result) tuples to organize.
+
+    Returns:
+    list: A list of (target folder, file path, os.stat_result) tuples sorted
+    by target folder, files keep their listing order within a folder.
+    """
+    planned = []
+    # Target folder per (year, month, day), most files share a few dates
+    folder_cache = {}
+    for file_path, file_stat in files:
+        date = get_creation_date_from_stat(file_stat, file_path)
+        target_folder = folder_cache.get(date)
+        if target_folder is None:
+            target_folder = folder_cache[date] = get_target_folder(args, *date)
+        planned.append((target_folder, file_path, file_stat))
+    planned.sort(key=lambda item: item[0])
+    return planned
+
+
+def organize_files(args, files):
+    """
+    Organize files by moving or copying them to the target directory.
+
+    Files are processed grouped by their target folder, so the writes into
+    a folder happen back-to-back. All target folders are created up front on
+    the calling thread, the transfers themselves run on a thread pool of
+    args.copy_threads workers in batches of args.batch_size files.
+
+    Parameters:
+    args (Namespace): Parsed command line arguments.
+    files (list): List of (file path, os.stat_result) tuples to organize.
+    """
+    # Hoist the per-run settings out of the per-file loop
+    do_copy = args.copy
+    fast_dedup = args.fast_dedup
+    target_root = args.target
+    batch_size = args.batch_size
+    join = os.path.join
+    basename = os.path.basename
+
+    planned = plan_files(args, files)
+    hash_cache = load_hash_cache(args.hash_cache) if args.hash_cache else None
+
+    # Create every target folder up front, in sorted order
+    for target_folder in dict.fromkeys(item[0] for item in planned):
+        ensure_directory_exists(target_folder)
+
+    # Transfers submitted during this run, keyed by target path
+    pending = {}
+    futures = []
+    failed = threading.Event()
+    target_dev = os.stat(target_root).st_dev
+
+    def submit(batch):
+        future = executor.submit(transfer_batch, batch, do_copy, hash_cache, failed)
+        futures.append(future)
+        for item in batch:
+            pending[item[1]] = future
+
+    # Transfers wait on I/O, so by default use more threads than CPUs
+    with ThreadPoolExecutor(max_workers=args.copy_threads) as executor:
+        try:
+            batch = []
+            for target_folder, file_path, file_stat in planned:
+                if failed.is_set():
+                    break
+                target_path = join(target_folder, basename(file_path))
+
+                # Another file with the same name may still be on its way there,
+                # within a batch the files are transferred in order anyway
+                if target_path in pending:
+                    pending.pop(target_path).result()
+
+                batch.append(
+                    (
+                        file_path,
+                        target_path,
+                        file_stat,
+                        file_stat.st_dev == target_dev,
+                        not fast_dedup
+                        or os.path.splitext(file_path)[1].lower() in PHOTO_EXTENSIONS,
+                    )
+                )
+                if len(batch) >= batch_size:
+                    submit(batch)
+                    batch = []
+            if batch and not failed.is_set():
+                submit(batch)
+
+            # Surface anything the transfers did not handle themselves
+            for future in futures:
+                future.result()
+        except BaseException:
+            # Let the queued transfers return early, e.g. on Ctrl-C
+            failed.set()
+            raise
+
+    if args.hash_cache:
+        save_hash_cache(args.hash_cache, hash_cache)
 
 
 def main():
@@ -196,20 +1015,38 @@ def main():
     args = parse_arguments()
 
     # Configure logging
-    configure_logging(args.verbose)
+    listener = configure_logging(args.verbose)
+    try:
+        run(args)
+    finally:
+        listener.stop()
 
-    logging.info("Starting file sorting process")
+
+def run(args):
+    """
+    Sort the files from the source into the target directory.
+
+    Parameters:
+    args (Namespace): Parsed command line arguments.
+    """
+    logger.info("Starting file sorting process")
 
     # Ensure the source directory exists
     if not os.path.exists(args.source):
-        logging.error(f"Source directory '{args.source}' does not exist.")
+        logger.error("Source directory '%s' does not exist.", args.source)
         return
 
     # Ensure the target directory exists
     ensure_directory_exists(args.target)
 
     # List all files in the source directory
-    files = list_files(args.source, args.recursive, args.endings)
+    files = list_files(
+        args.source,
+        args.recursive,
+        args.endings,
+        args.stat_threads,
+        args.one_filesystem,
+    )
 
     # Organize files by moving or copying them to the target directory
     organize_files(args, files)
@@ -1,31 +1,75 @@
 import pytest
+import errno
+import io
 import os
+import signal
+import sys
+import threading
 import tempfile
-import shutil
+import time
 from datetime import datetime
+from argparse import Namespace
 from unittest.mock import patch
 from photo_organizer.main import (
+    _creation_date_from_timestamp,
+    _read_blocks_equal,
+    _no_clone_devices,
+    _utc_offset,
     list_files,
     get_creation_date,
+    get_creation_date_from_stat,
+    copy_file,
     ensure_directory_exists,
+    files_are_identical,
+    load_hash_cache,
+    move_file,
     organize_files,
+    parse_arguments,
+    plan_files,
+    save_hash_cache,
 )
 
 
+def create_sample_files(source_dir):
+    # Create some test files
+    file_paths = [
+        os.path.join(source_dir, "photo1.jpg"),
+        os.path.join(source_dir, "photo2.png"),
+        os.path.join(source_dir, "document.txt"),
+    ]
+    for file_path in file_paths:
+        with open(file_path, "w") as f:
+            f.write("test")
+    return file_paths
+
+
+def make_args(target_dir, **overrides):
+    # Arguments as parsed for a plain copy, override what a test needs
+    args = Namespace(
+        target=target_dir,
+        daily=False,
+        no_year=False,
+        copy=True,
+        copy_threads=2,
+        batch_size=1,
+        fast_dedup=False,
+        hash_cache=None,
+    )
+    vars(args).update(overrides)
+    return args
+
+
 @pytest.fixture
 def setup_source_directory():
     with tempfile.TemporaryDirectory() as source_dir:
-        # Create some test files
-        file_paths = [
-            os.path.join(source_dir, "photo1.jpg"),
-            os.path.join(source_dir, "photo2.png"),
-            os.path.join(source_dir, "document.txt"),
-        ]
-        for file_path in file_paths:
-            with open(file_path, "w") as f:
-                f.write("test")
+        yield source_dir, create_sample_files(source_dir)
 
-        yield source_dir, file_paths
+
+@pytest.fixture(scope="session")
+def sample_source_directory():
+    # Shared by the tests that only read the source, do not modify it
+    with tempfile.TemporaryDirectory() as source_dir:
+        yield source_dir, tuple(create_sample_files(source_dir))
 
 
 @pytest.fixture
@@ -34,13 +78,13 @@ def setup_target_directory():
         yield target_dir
 
 
-def test_list_files_non_recursive(setup_source_directory):
-    source_dir, file_paths = setup_source_directory
+def test_list_files_non_recursive(sample_source_directory):
+    source_dir, file_paths = sample_source_directory
     files = list_files(source_dir, recursive=False)
     assert len(files) == 3
     assert all(
         os.path.basename(f) in ["photo1.jpg", "photo2.png", "document.txt"]
-        for f in files
+        for f, _ in files
     )
 
 
@@ -54,18 +98,51 @@ def test_list_files_recursive(setup_source_directory):
 
     files = list_files(source_dir, recursive=True)
     assert len(files) == 4
-    assert any(os.path.basename(f) == "subphoto.jpg" for f in files)
+    assert any(os.path.basename(f) == "subphoto.jpg" for f, _ in files)
 
 
-def test_list_files_with_endings(setup_source_directory):
+def test_list_files_one_filesystem(setup_source_directory):
     source_dir, file_paths = setup_source_directory
+    sub_dir = os.path.join(source_dir, "subdir")
+    os.makedirs(sub_dir)
+    with open(os.path.join(sub_dir, "subphoto.jpg"), "w") as f:
+        f.write("test")
+
+    files = list_files(source_dir, recursive=True, one_filesystem=True)
+    assert len(files) == 4
+
+    # Pretend the source is on another device than its subdirectory
+    class OtherDevice:
+        st_dev = -1
+
+    with patch("photo_organizer.main.os.stat", return_value=OtherDevice()):
+        files = list_files(source_dir, recursive=True, one_filesystem=True)
+    assert sorted(os.path.basename(f) for f, _ in files) == [
+        "document.txt",
+        "photo1.jpg",
+        "photo2.png",
+    ]
+
+
+def test_list_files_with_endings(sample_source_directory):
+    source_dir, file_paths = sample_source_directory
     files = list_files(source_dir, recursive=False, file_endings=[".jpg"])
     assert len(files) == 1
-    assert os.path.basename(files[0]) == "photo1.jpg"
+    assert os.path.basename(files[0][0]) == "photo1.jpg"
+    assert files[0][1].st_size == 4
 
 
-def test_get_creation_date(setup_source_directory):
-    source_dir, file_paths = setup_source_directory
+def test_list_files_with_uppercase_endings(sample_source_directory):
+    source_dir, file_paths = sample_source_directory
+    files = list_files(source_dir, recursive=False, file_endings=[".JPG", ".Png"])
+    assert sorted(os.path.basename(f) for f, _ in files) == [
+        "photo1.jpg",
+        "photo2.png",
+    ]
+
+
+def test_get_creation_date(sample_source_directory):
+    source_dir, file_paths = sample_source_directory
     file_path = file_paths[0]
     year, month, day = get_creation_date(file_path)
     now = datetime.now()
@@ -74,6 +151,85 @@ def test_get_creation_date(setup_source_directory):
     assert day == now.day
 
 
+def test_get_creation_date_from_stat(sample_source_directory):
+    source_dir, file_paths = sample_source_directory
+    file_path = file_paths[0]
+    assert get_creation_date_from_stat(
+        os.stat(file_path), file_path
+    ) == get_creation_date(file_path)
+
+
+def test_get_creation_date_reuses_stat(sample_source_directory):
+    source_dir, file_paths = sample_source_directory
+    file_path = file_paths[0]
+    file_stat = os.stat(file_path)
+    with patch("photo_organizer.main.os.stat") as mock_stat:
+        assert get_creation_date(file_path, file_stat) == get_creation_date_from_stat(
+            file_stat, file_path
+        )
+    mock_stat.assert_not_called()
+
+
+@pytest.mark.parametrize(
+    "timestamp", [-86401.5, 0, 951782400, 1711846799, 1711846800, 4102444800.25]
+)
+def test_creation_date_from_timestamp_matches_localtime(timestamp):
+    local = time.localtime(timestamp)
+    assert _creation_date_from_timestamp(timestamp, "photo.jpg") == (
+        local.tm_year,
+        local.tm_mon,
+        local.tm_mday,
+    )
+
+
+@pytest.fixture
+def local_timezone(monkeypatch):
+    if not hasattr(time, "tzset"):
+        pytest.skip("time.tzset is not available on this platform")
+
+    def set_timezone(name):
+        monkeypatch.setenv("TZ", name)
+        time.tzset()
+        _utc_offset.cache_clear()
+
+    yield set_timezone
+    monkeypatch.undo()
+    time.tzset()
+    _utc_offset.cache_clear()
+
+
+@pytest.mark.parametrize(
+    "timezone,start",
+    [
+        # Newfoundland switched at 00:01 local time, off the quarter hours
+        ("America/St_Johns", 954646260),
+        ("America/St_Johns", 972786660),
+        ("Australia/Adelaide", 1712421000),
+        ("Europe/Berlin", 1711846800),
+    ],
+)
+def test_creation_date_from_timestamp_across_dst_changes(
+    local_timezone, timezone, start
+):
+    local_timezone(timezone)
+    # Minute by minute through the two days around the change
+    for timestamp in range(start - 86400, start + 86400, 60):
+        local = time.localtime(timestamp)
+        assert _creation_date_from_timestamp(timestamp, "photo.jpg") == (
+            local.tm_year,
+            local.tm_mon,
+            local.tm_mday,
+        ), timestamp
+
+
+@pytest.mark.parametrize("option", ["--copy-threads", "--batch-size", "--stat-threads"])
+@pytest.mark.parametrize("value", ["0", "-1", "many"])
+def test_parse_arguments_rejects_non_positive_counts(option, value):
+    with patch("sys.argv", ["photo-organizer", "source", "target", option, value]):
+        with pytest.raises(SystemExit):
+            parse_arguments()
+
+
 def test_ensure_directory_exists():
     with tempfile.TemporaryDirectory() as temp_dir:
         new_dir = os.path.join(temp_dir, "newdir")
@@ -81,121 +237,412 @@ def test_ensure_directory_exists():
         assert os.path.exists(new_dir)
 
 
-@patch("photo_organizer.main.get_creation_date", return_value=(2021, 1, 1))
-@patch("photo_organizer.main.shutil.copy2")
-def test_organize_files_copy(
-    mock_copy, mock_get_creation_date, setup_source_directory, setup_target_directory
+def test_ensure_directory_exists_nested_and_existing():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        new_dir = os.path.join(temp_dir, "2024", "05")
+        ensure_directory_exists(new_dir)
+        assert os.path.isdir(new_dir)
+        ensure_directory_exists(new_dir)
+        assert os.path.isdir(new_dir)
+
+
+@pytest.mark.parametrize(
+    "source_content,target_content,expected",
+    [
+        (b"a" * 10000, b"a" * 10000, True),
+        (b"a" * 10000, b"a" * 9999, False),
+        (b"a" * 10000, b"b" + b"a" * 9999, False),
+        (b"a" * 10000, b"a" * 9999 + b"b", False),
+        (b"", b"", True),
+        (b"a" * 3000000, b"a" * 3000000, True),
+        (b"a" * 3000000, b"a" * 2999999 + b"b", False),
+        (b"a" * 3000000, b"a" * 1500000 + b"b" + b"a" * 1499999, False),
+        (b"a" * 3000000, b"a" * 2000000 + b"b" + b"a" * 999999, False),
+    ],
+)
+def test_files_are_identical(
+    setup_target_directory, source_content, target_content, expected
+):
+    source_path = os.path.join(setup_target_directory, "source.jpg")
+    target_path = os.path.join(setup_target_directory, "target.jpg")
+    with open(source_path, "wb") as f:
+        f.write(source_content)
+    with open(target_path, "wb") as f:
+        f.write(target_content)
+    assert files_are_identical(source_path, target_path) is expected
+
+
+def test_files_are_identical_sampled_only(setup_target_directory):
+    source_path = os.path.join(setup_target_directory, "source.mp4")
+    target_path = os.path.join(setup_target_directory, "target.mp4")
+    with open(source_path, "wb") as f:
+        f.write(b"a" * 3000000)
+    with open(target_path, "wb") as f:
+        f.write(b"a" * 1200000 + b"b" + b"a" * 1799999)
+    assert not files_are_identical(source_path, target_path)
+    assert files_are_identical(source_path, target_path, full_compare=False)
+
+
+def test_files_are_identical_hash_cache(setup_target_directory):
+    source_path = os.path.join(setup_target_directory, "source.jpg")
+    target_path = os.path.join(setup_target_directory, "target.jpg")
+    cache_path = os.path.join(setup_target_directory, "cache", "hashes.db")
+    for path in (source_path, target_path):
+        with open(path, "wb") as f:
+            f.write(b"a" * 3000000)
+
+    hash_cache = load_hash_cache(cache_path)
+    assert hash_cache == {}
+    assert files_are_identical(source_path, target_path, hash_cache=hash_cache)
+    assert len(hash_cache) == 2
+    save_hash_cache(cache_path, hash_cache)
+
+    hash_cache = load_hash_cache(cache_path)
+    assert len(hash_cache) == 2
+    with patch("photo_organizer.main.open") as mock_open:
+        assert files_are_identical(source_path, target_path, hash_cache=hash_cache)
+    assert not mock_open.called
+
+
+@pytest.mark.parametrize("content", [b"", b"not a database"])
+def test_load_hash_cache_unreadable(setup_target_directory, content):
+    cache_path = os.path.join(setup_target_directory, "hashes.db")
+    with open(cache_path, "wb") as f:
+        f.write(content)
+    assert load_hash_cache(cache_path) == {}
+    save_hash_cache(cache_path, {(1, 2): (3, 4, b"digest")})
+
+
+def test_files_are_identical_without_mmap(setup_target_directory):
+    source_path = os.path.join(setup_target_directory, "source.jpg")
+    target_path = os.path.join(setup_target_directory, "target.jpg")
+    for path, tail in [(source_path, b"a"), (target_path, b"b")]:
+        with open(path, "wb") as f:
+            f.write(b"a" * 10000 + tail)
+    with patch("photo_organizer.main.mmap.mmap", side_effect=OSError):
+        assert not files_are_identical(source_path, target_path)
+        assert files_are_identical(source_path, source_path)
+
+
+def test_read_blocks_equal_short_reads():
+    class ShortReads(io.RawIOBase):
+        # Returns at most limit bytes per read, like some FUSE mounts
+        def __init__(self, data, limit):
+            self.data = io.BytesIO(data)
+            self.limit = limit
+
+        def readable(self):
+            return True
+
+        def readinto(self, buffer):
+            chunk = self.data.read(min(len(buffer), self.limit))
+            buffer[: len(chunk)] = chunk
+            return len(chunk)
+
+    data = os.urandom(3 * 1024 * 1024 + 5)
+    with patch("photo_organizer.main.BLOCK_SIZE", 1 << 16):
+        assert _read_blocks_equal(ShortReads(data, 7000), ShortReads(data, 11000))
+        assert not _read_blocks_equal(
+            ShortReads(data, 7000), ShortReads(data[:-1] + b"x", 11000)
+        )
+
+
+@pytest.mark.parametrize("platform", ["linux", "darwin"])
+@pytest.mark.parametrize("same_device", [True, False])
+def test_copy_file(
+    setup_source_directory, setup_target_directory, same_device, platform
 ):
     source_dir, file_paths = setup_source_directory
-    target_dir = setup_target_directory
+    os.utime(file_paths[0], (1600000000, 1600000000))
+    target_path = os.path.join(setup_target_directory, "photo1.jpg")
+    with patch("photo_organizer.main.sys.platform", platform):
+        copy_file(file_paths[0], target_path, same_device=same_device)
+    with open(target_path) as f:
+        assert f.read() == "test"
+    assert os.stat(target_path).st_mtime == 1600000000
+    assert os.path.exists(file_paths[0])
+
+
+@pytest.mark.skipif(
+    not hasattr(os, "copy_file_range"), reason="needs os.copy_file_range"
+)
+def test_copy_file_range_stops_short(setup_target_directory):
+    source_path = os.path.join(setup_target_directory, "source.jpg")
+    target_path = os.path.join(setup_target_directory, "target.jpg")
+    content = os.urandom(300000)
+    with open(source_path, "wb") as f:
+        f.write(content)
+
+    real_copy_file_range = os.copy_file_range
+    calls = []
+
+    def copy_file_range(src, dst, count, offset_src, offset_dst):
+        # Copy part of the file, then report no progress like some FUSE mounts
+        calls.append(count)
+        if len(calls) > 1:
+            return 0
+        return real_copy_file_range(src, dst, 1000, offset_src, offset_dst)
+
+    with patch("fcntl.ioctl", side_effect=OSError(errno.EOPNOTSUPP, "")):
+        with patch("photo_organizer.main.os.copy_file_range", copy_file_range):
+            copy_file(source_path, target_path, same_device=True)
+    with open(target_path, "rb") as f:
+        assert f.read() == content
+
+
+@pytest.mark.skipif(not hasattr(os, "sendfile"), reason="needs os.sendfile")
+def test_copy_file_truncated_copy_fails(setup_source_directory, setup_target_directory):
+    source_dir, file_paths = setup_source_directory
+    target_path = os.path.join(setup_target_directory, "photo1.jpg")
+    with patch("photo_organizer.main.sys.platform", "linux"):
+        with patch("photo_organizer.main.os.sendfile", return_value=0):
+            with pytest.raises(OSError):
+                copy_file(file_paths[0], target_path, same_device=False)
+    assert not os.path.exists(target_path)
 
-    class Args:
-        def __init__(self):
-            self.target = target_dir
-            self.daily = False
-            self.no_year = False
-            self.copy = True
 
-    args = Args()
-    organize_files(args, file_paths)
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="Linux only")
+def test_copy_file_remembers_unsupported_clone(
+    setup_source_directory, setup_target_directory
+):
+    source_dir, file_paths = setup_source_directory
+    _no_clone_devices.clear()
+    with patch(
+        "fcntl.ioctl", side_effect=OSError(errno.EOPNOTSUPP, "Not supported")
+    ) as mock_ioctl:
+        for file_path in file_paths:
+            target_path = os.path.join(
+                setup_target_directory, os.path.basename(file_path)
+            )
+            copy_file(file_path, target_path, same_device=True)
+            with open(target_path) as f:
+                assert f.read() == "test"
+    assert mock_ioctl.call_count == 1
+    _no_clone_devices.clear()
 
-    target_folder = os.path.join(target_dir, "2021", "01")
-    target_file_path = os.path.join(target_folder, "photo1.jpg")
-    assert os.path.exists(target_folder)
-    assert mock_copy.called
 
+def test_move_file_same_device(setup_source_directory, setup_target_directory):
+    source_dir, file_paths = setup_source_directory
+    target_path = os.path.join(setup_target_directory, "photo1.jpg")
+    with patch("photo_organizer.main.shutil.move") as mock_move:
+        move_file(file_paths[0], target_path, same_device=True)
+    assert not mock_move.called
+    assert os.path.exists(target_path)
+    assert not os.path.exists(file_paths[0])
 
-@patch("photo_organizer.main.get_creation_date", return_value=(2021, 1, 1))
-@patch("photo_organizer.main.shutil.move")
-def test_organize_files_move(
-    mock_move, mock_get_creation_date, setup_source_directory, setup_target_directory
+
+def test_move_file_cross_device_falls_back(
+    setup_source_directory, setup_target_directory
+):
+    source_dir, file_paths = setup_source_directory
+    target_path = os.path.join(setup_target_directory, "photo1.jpg")
+    with patch(
+        "photo_organizer.main.os.link", side_effect=OSError(errno.EXDEV, "EXDEV")
+    ), patch(
+        "photo_organizer.main.os.replace", side_effect=OSError(errno.EXDEV, "EXDEV")
+    ), patch(
+        "photo_organizer.main.shutil.move"
+    ) as mock_move:
+        move_file(file_paths[0], target_path, same_device=True)
+    mock_move.assert_called_once_with(file_paths[0], target_path)
+
+
+@pytest.mark.parametrize("platform", ["linux", "darwin"])
+@pytest.mark.parametrize("same_device", [True, False])
+@pytest.mark.parametrize("transfer", [copy_file, move_file])
+def test_transfer_does_not_replace_existing(
+    setup_source_directory, setup_target_directory, same_device, transfer, platform
+):
+    source_dir, file_paths = setup_source_directory
+    target_path = os.path.join(setup_target_directory, "photo1.jpg")
+    with open(target_path, "w") as f:
+        f.write("existing")
+    with patch("photo_organizer.main.sys.platform", platform):
+        with pytest.raises(FileExistsError):
+            transfer(file_paths[0], target_path, same_device=same_device)
+    with open(target_path) as f:
+        assert f.read() == "existing"
+    assert os.path.exists(file_paths[0])
+
+
+@pytest.mark.parametrize(
+    "daily,no_year,copy,sub_folders",
+    [
+        (False, False, True, ["2021", "01"]),
+        (False, False, False, ["2021", "01"]),
+        (False, True, False, ["2021-01"]),
+        (True, False, False, ["2021", "01", "01"]),
+        (True, True, False, ["2021-01", "01"]),
+    ],
+)
+@patch("photo_organizer.main.get_creation_date_from_stat", return_value=(2021, 1, 1))
+@patch("photo_organizer.main.move_file")
+@patch("photo_organizer.main.copy_file")
+def test_organize_files(
+    mock_copy,
+    mock_move,
+    mock_get_creation_date,
+    setup_source_directory,
+    setup_target_directory,
+    daily,
+    no_year,
+    copy,
+    sub_folders,
 ):
     source_dir, file_paths = setup_source_directory
     target_dir = setup_target_directory
 
-    class Args:
-        def __init__(self):
-            self.target = target_dir
-            self.daily = False
-            self.no_year = False
-            self.copy = False
-
-    args = Args()
-    organize_files(args, file_paths)
+    args = make_args(target_dir, daily=daily, no_year=no_year, copy=copy)
+    organize_files(args, [(f, os.stat(f)) for f in file_paths])
 
-    target_folder = os.path.join(target_dir, "2021", "01")
+    target_folder = os.path.join(target_dir, *sub_folders)
     target_file_path = os.path.join(target_folder, "photo1.jpg")
     assert os.path.exists(target_folder)
-    assert mock_move.called
+    mock_transfer, mock_unused = (
+        (mock_copy, mock_move) if copy else (mock_move, mock_copy)
+    )
+    assert any(
+        call.args[:2] == (file_paths[0], target_file_path)
+        for call in mock_transfer.call_args_list
+    )
+    assert not mock_unused.called
 
 
-@patch("photo_organizer.main.get_creation_date", return_value=(2021, 1, 1))
-@patch("photo_organizer.main.shutil.move")
-def test_organize_files_no_year(
-    mock_move, mock_get_creation_date, setup_source_directory, setup_target_directory
+def test_list_files_stat_threads(setup_source_directory):
+    source_dir, file_paths = setup_source_directory
+    os.makedirs(os.path.join(source_dir, "subdir"))
+    files = list_files(source_dir, recursive=False, stat_threads=4)
+    assert sorted(f for f, _ in files) == sorted(file_paths)
+
+
+def test_list_files_recursive_scan_threads(setup_source_directory):
+    source_dir, file_paths = setup_source_directory
+    for sub_dir in ["a", os.path.join("a", "b"), "c"]:
+        os.makedirs(os.path.join(source_dir, sub_dir))
+        file_path = os.path.join(source_dir, sub_dir, "photo.jpg")
+        with open(file_path, "w") as f:
+            f.write("test")
+        file_paths.append(file_path)
+
+    files = list_files(source_dir, recursive=True, stat_threads=4)
+    assert sorted(f for f, _ in files) == sorted(file_paths)
+    # The parallel walk still lists in a deterministic order
+    again = list_files(source_dir, recursive=True, stat_threads=4)
+    assert [f for f, _ in again] == [f for f, _ in files]
+
+
+@patch("photo_organizer.main.get_creation_date_from_stat", return_value=(2021, 1, 1))
+@patch("photo_organizer.main.copy_file")
+@patch("photo_organizer.main.ensure_directory_exists")
+def test_organize_files_ensures_folder_once(
+    mock_ensure,
+    mock_copy,
+    mock_get_creation_date,
+    setup_source_directory,
+    setup_target_directory,
 ):
     source_dir, file_paths = setup_source_directory
     target_dir = setup_target_directory
 
-    class Args:
-        def __init__(self):
-            self.target = target_dir
-            self.daily = False
-            self.no_year = True
-            self.copy = False
+    args = make_args(target_dir)
+    organize_files(args, [(f, os.stat(f)) for f in file_paths])
 
-    args = Args()
-    organize_files(args, file_paths)
+    mock_ensure.assert_called_once_with(os.path.join(target_dir, "2021", "01"))
+    assert mock_copy.call_count == 3
 
-    target_folder = os.path.join(target_dir, "2021-01")
-    target_file_path = os.path.join(target_folder, "photo1.jpg")
-    assert os.path.exists(target_folder)
-    assert mock_move.called
 
-
-@patch("photo_organizer.main.get_creation_date", return_value=(2021, 1, 1))
-@patch("photo_organizer.main.shutil.move")
-def test_organize_files_daily(
-    mock_move, mock_get_creation_date, setup_source_directory, setup_target_directory
+@patch("photo_organizer.main.get_creation_date_from_stat", return_value=(2021, 1, 1))
+@patch(
+    "photo_organizer.main.files_are_identical",
+    side_effect=OSError(errno.EIO, "I/O error"),
+)
+def test_organize_files_compare_error_is_logged(
+    mock_identical,
+    mock_get_creation_date,
+    setup_source_directory,
+    setup_target_directory,
+    caplog,
 ):
     source_dir, file_paths = setup_source_directory
     target_dir = setup_target_directory
+    target_folder = os.path.join(target_dir, "2021", "01")
+    os.makedirs(target_folder)
+    with open(os.path.join(target_folder, "photo1.jpg"), "w") as f:
+        f.write("existing")
 
-    class Args:
-        def __init__(self):
-            self.target = target_dir
-            self.daily = True
-            self.no_year = False
-            self.copy = False
+    args = make_args(target_dir, copy_threads=1)
+    organize_files(args, [(f, os.stat(f)) for f in sorted(file_paths)])
 
-    args = Args()
-    organize_files(args, file_paths)
+    assert mock_identical.called
+    assert "Failed to compare" in caplog.text
+    # The failure stops the transfers queued after it
+    assert not os.path.exists(os.path.join(target_folder, "photo2.png"))
 
-    target_folder = os.path.join(target_dir, "2021", "01", "01")
-    target_file_path = os.path.join(target_folder, "photo1.jpg")
-    assert os.path.exists(target_folder)
-    assert mock_move.called
 
-
-@patch("photo_organizer.main.get_creation_date", return_value=(2021, 1, 1))
-@patch("photo_organizer.main.shutil.move")
-def test_organize_files_no_year_daily(
-    mock_move, mock_get_creation_date, setup_source_directory, setup_target_directory
+@pytest.mark.skipif(os.name == "nt", reason="needs a real SIGINT")
+@patch("photo_organizer.main.get_creation_date_from_stat", return_value=(2021, 1, 1))
+@patch("photo_organizer.main.copy_file", side_effect=lambda *args: time.sleep(0.05))
+def test_organize_files_interrupt_skips_queued(
+    mock_copy, mock_get_creation_date, setup_source_directory, setup_target_directory
 ):
     source_dir, file_paths = setup_source_directory
+    file_stat = os.stat(file_paths[0])
+    files = [(os.path.join(source_dir, f"photo{i}.jpg"), file_stat) for i in range(40)]
+
+    args = make_args(setup_target_directory, copy_threads=1)
+    timer = threading.Timer(0.1, os.kill, (os.getpid(), signal.SIGINT))
+    timer.start()
+    try:
+        with pytest.raises(KeyboardInterrupt):
+            organize_files(args, files)
+    finally:
+        timer.cancel()
+    # Queued transfers must not keep running after the interrupt
+    time.sleep(0.5)
+    assert mock_copy.call_count < 10
+
+
+@pytest.mark.parametrize("batch_size", [1, 2])
+@patch("photo_organizer.main.get_creation_date_from_stat", return_value=(2021, 1, 1))
+def test_organize_files_same_name_in_flight(
+    mock_get_creation_date, setup_target_directory, batch_size
+):
     target_dir = setup_target_directory
+    with tempfile.TemporaryDirectory() as source_dir:
+        files = []
+        for sub_dir, content in [("a", "same"), ("b", "same"), ("c", "other")]:
+            os.makedirs(os.path.join(source_dir, sub_dir))
+            file_path = os.path.join(source_dir, sub_dir, "photo.jpg")
+            with open(file_path, "w") as f:
+                f.write(content)
+            files.append((file_path, os.stat(file_path)))
 
-    class Args:
-        def __init__(self):
-            self.target = target_dir
-            self.daily = True
-            self.no_year = True
-            self.copy = False
+        args = make_args(target_dir, copy_threads=4, batch_size=batch_size)
+        organize_files(args, files)
 
-    args = Args()
-    organize_files(args, file_paths)
+    target_path = os.path.join(target_dir, "2021", "01", "photo.jpg")
+    with open(target_path) as f:
+        assert f.read() == "same"
 
-    target_folder = os.path.join(target_dir, "2021-01", "01")
-    target_file_path = os.path.join(target_folder, "photo1.jpg")
-    assert os.path.exists(target_folder)
-    assert mock_move.called
+
+def test_plan_files_groups_by_folder(setup_source_directory, setup_target_directory):
+    source_dir, file_paths = setup_source_directory
+    target_dir = setup_target_directory
+    dates = {
+        file_paths[0]: (2021, 2, 1),
+        file_paths[1]: (2021, 1, 1),
+        file_paths[2]: (2021, 2, 3),
+    }
+
+    args = make_args(target_dir)
+    with patch(
+        "photo_organizer.main.get_creation_date_from_stat",
+        side_effect=lambda st, path: dates[path],
+    ):
+        planned = plan_files(args, [(f, os.stat(f)) for f in file_paths])
+
+    assert [(folder, path) for folder, path, _ in planned] == [
+        (os.path.join(target_dir, "2021", "01"), file_paths[1]),
+        (os.path.join(target_dir, "2021", "02"), file_paths[0]),
+        (os.path.join(target_dir, "2021", "02"), file_paths[2]),
+    ]
@@ -0,0 +1,24 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+from photo_organizer import _statx
+
+
+def test_statx_mtime_matches_stat():
+    with tempfile.NamedTemporaryFile() as f:
+        os.utime(f.name, (1600000000.5, 1600000000.5))
+        assert _statx.statx_mtime(f.name) == pytest.approx(os.stat(f.name).st_mtime)
+
+
+def test_statx_mtime_missing_file():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        with pytest.raises(FileNotFoundError):
+            _statx.statx_mtime(os.path.join(temp_dir, "missing.jpg"))
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="Linux only")
+def test_statx_struct_size():
+    assert _statx.ctypes.sizeof(_statx._Statx) == 256